@@ -16,22 +16,41 @@
 # - Como processar requisições antes de chegar no handler
 # - Dá gancho para como limitar permissões com base em roles
 
-import json
+import asyncio
 import time
+from collections import OrderedDict
+from hashlib import blake2b
 from pathlib import Path
 from typing import List
 
+# orjson → parser/serializador JSON em Rust, bem mais rápido que o stdlib
+# Usado no load do JWKS e na decodificação de header/payload do JWT
+import orjson
+
 # PyJWT → biblioteca para gerar e validar tokens JWT
 import jwt #PyJWT
 from jwt import PyJWTError
 from jwt.algorithms import RSAAlgorithm
 
+# cryptography → usada para carregar a chave privada UMA vez como objeto
+# e para verificar a assinatura RS256 direto no OpenSSL (caminho nativo)
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
 # FastAPI → Request permite acessar header; HTTPException retorna erros padrão
+# JSONResponse → rejeições do MIDDLEWARE precisam ser respostas construídas à
+# mão: HTTPException levantada dentro de um middleware "http" NÃO passa pelos
+# exception handlers do FastAPI (eles ficam abaixo na pilha) e viraria 500
 from fastapi import Request, HTTPException, APIRouter
-from fastapi.security.utils import get_authorization_scheme_param
+from fastapi.responses import JSONResponse
 
 #Pydantic para validar corpo de login
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+
+from src.config import settings
 
 # --------------------------------------------------
 # Carregar JWKS (JSON Web Key Set)
@@ -43,16 +62,119 @@ from pydantic import BaseModel
 # Em produção
 # - As chaves mudam automaticamente quando Cognito faz "key rotation"
 # - A API precisa buscar e cachear as novas chaves
-JWKS_PATH = Path(__file__).parent.parent / "infra" / "jwks.json"
-with open(JWKS_PATH) as f:
-    JWKS = json.load(f)
+JWKS_PATH = Path(settings.JWKS_PATH)
+
+class JWKSCache:
+    """
+    Cache de chaves públicas do JWKS com TTL e refresh sob demanda
+    - Guarda {kid -> RSAPublicKey} JÁ parseada (o parse de chave roda uma vez
+      por rotação, nunca por requisição — RSAAlgorithm.from_jwk aceita o dict
+      direto, sem re-serializar com json.dumps)
+    - kid desconhecido ou TTL vencido → recarrega a fonte (rotação do Cognito)
+    - single-flight: um asyncio.Lock garante que só UMA coroutine refaz o
+      fetch por vez; as demais esperam e reutilizam o resultado
+    Em produção a fonte seria a URL .well-known/jwks.json do User Pool;
+    aqui é o arquivo local, mas o fluxo de cache é o mesmo
+    """
 
-# Montamos um dicionário {kid -> chave pública}
-# O "kid" (Key ID) está no header do Jwt e serve para escolher a chave correta
-PUBLIC_KEYS = {}
-for key in JWKS["keys"]:
-    kid = key["kid"]
-    PUBLIC_KEYS[kid] = RSAAlgorithm.from_jwk(json.dumps(key))
+    def __init__(self, source_path: Path, ttl_seconds: float = 600.0):
+        self._source_path = source_path
+        self._ttl = ttl_seconds
+        self._lock = asyncio.Lock()
+        self._keys: dict = {}
+        self._fetched_at = 0.0
+        # Primeira carga é síncrona no import → falha cedo se o JWKS não existir
+        self._reload()
+
+    def _reload(self):
+        """Lê e parseia a fonte do JWKS (num Cognito real: GET na keys_url)"""
+        jwks = orjson.loads(self._source_path.read_bytes())
+        self._keys = {k["kid"]: RSAAlgorithm.from_jwk(k) for k in jwks["keys"]}
+        self._fetched_at = time.time()
+
+    async def refresh(self):
+        """Recarrega o JWKS com single-flight (um refetch por vez)"""
+        async with self._lock:
+            # double-check: outra coroutine pode ter recarregado enquanto esperávamos
+            if time.time() - self._fetched_at < 1.0:
+                return
+            self._reload()
+
+    async def get(self, kid: str):
+        """
+        Retorna a RSAPublicKey para o kid, ou None se não existir
+        - Hit dentro do TTL: lookup O(1), sem I/O
+        - kid desconhecido ou cache velho: refresh e nova tentativa
+        """
+        key = self._keys.get(kid)
+        if key is not None and time.time() - self._fetched_at < self._ttl:
+            return key
+        await self.refresh()
+        return self._keys.get(kid)
+
+jwks_cache = JWKSCache(JWKS_PATH)
+
+# --------------------------------------------------
+# Verificação RS256 "manual" (caminho quente)
+# --------------------------------------------------
+# O jwt.decode do PyJWT refaz em Python puro todo o pipeline:
+# split, base64, json, validações de claim, e só então a assinatura
+# Aqui fazemos o mínimo em Python e delegamos o trabalho pesado
+# (SHA-256 + verificação RSA PKCS#1 v1.5) direto ao OpenSSL via cryptography
+# PyJWT continua sendo usado apenas para ler o header (kid) e para assinar
+def _b64url(seg: bytes) -> bytes:
+    """
+    Decodifica base64url com o padding EXATO calculado via (-len) % 4
+    - O truque usual de somar b"==" sempre aloca um tail novo, mesmo quando
+      o segmento já está alinhado; aqui só concatenamos quando precisa
+    """
+    return urlsafe_b64decode(seg + b"=" * (-len(seg) % 4))
+
+def _split(token: bytes):
+    """
+    Divide o JWS uma única vez em (header_b64, payload_b64, sig_b64, signing_input)
+    - signing_input é "header.payload", exatamente o que a assinatura cobre
+    - Evita que header e payload sejam re-divididos/decodificados duas vezes
+      (antes: get_unverified_header fazia split+b64+json e jwt.decode repetia tudo)
+    """
+    header_b64, _, rest = token.partition(b".")
+    payload_b64, _, sig_b64 = rest.partition(b".")
+    if not payload_b64 or not sig_b64:
+        raise jwt.DecodeError("Token malformado")
+    return header_b64, payload_b64, sig_b64, header_b64 + b"." + payload_b64
+
+def verify_rs256(signing_input: bytes, payload_b64: bytes, sig_b64: bytes, public_key) -> dict:
+    """
+    Verifica a assinatura RS256 sobre partes já divididas e retorna as claims
+    - signing_input / payload_b64 / sig_b64: saída de _split
+    - public_key: RSAPublicKey já parseada (de PUBLIC_KEYS)
+    Lança exceções do PyJWT para manter o tratamento de erro existente
+    """
+    try:
+        signature = _b64url(sig_b64)
+        payload = orjson.loads(_b64url(payload_b64))
+    except (ValueError, TypeError):
+        raise jwt.DecodeError("Token malformado")
+
+    # Checamos o exp ANTES da verificação RSA
+    # - Decodificar o payload custa ~1000x menos que a verificação de assinatura
+    # - Token expirado (retry atrasado, cliente com token velho) é rejeitado
+    #   sem pagar o RSA; é seguro porque um exp forjado só faz o próprio
+    #   token do cliente ser recusado mais cedo — nada é aceito sem assinatura
+    exp = payload.get("exp")
+    if exp is not None and int(exp) < time.time():
+        raise jwt.ExpiredSignatureError("Token expirado")
+
+    try:
+        # OpenSSL calcula o SHA-256 e verifica a assinatura em código nativo
+        # Importante: passamos o signing_input cru e deixamos o OpenSSL fazer o
+        # digest (ele usa SHA-NI/AVX quando a CPU suporta). NÃO pré-calcular com
+        # hashlib + Prehashed — seria um digest a mais em Python sem ganho algum
+        public_key.verify(signature, signing_input, PKCS1v15(), SHA256())
+    except InvalidSignature:
+        raise jwt.InvalidSignatureError("Assinatura inválida")
+
+    return payload
 
 # --------------------------------------------------
 # Middleware de autenticação JWT
@@ -68,38 +190,99 @@ for key in JWKS["keys"]:
 # - Como autenticar com JWT
 # - Quais claims estão disponíveis no token
 # - Como se intercepta requests no middleware
+# --------------------------------------------------
+# Cache LRU de tokens já verificados
+# --------------------------------------------------
+# Clientes reais reutilizam o mesmo JWT em muitas requisições dentro da
+# janela de validade — re-verificar a assinatura RSA toda vez é desperdício
+# Guardamos {hash do token -> (exp, claims)} em um OrderedDict limitado:
+# - hit com token ainda válido → lookup O(1), sem RSA
+# - miss → verificação completa e inserção; estouro remove o mais antigo
+# A chave é blake2b(token) para não reter o token inteiro em memória
+_VERIFIED_MAX = 4096
+_VERIFIED: "OrderedDict[bytes, tuple[float, dict]]" = OrderedDict()
+
+# Prefixos de rotas públicas (sem autenticação)
+# str.startswith aceita uma tupla e resolve tudo em um único loop em C
+# → um só teste por requisição em vez de dois startswith encadeados
+_PUBLIC_PREFIXES = ("/v1/health", "/v1/auth/login")
+
+def _reject_401(detail: str) -> JSONResponse:
+    """Resposta 401 estruturada ({"detail": ...}, mesmo formato do FastAPI)"""
+    return JSONResponse(status_code=401, content={"detail": detail})
+
 async def jwt_auth_middleware(request: Request, call_next):
 
     # Permitimos algumas rotas públicas (sem autenticação)
-    if request.url.path.startswith("/v1/health") or request.url.path.startswith("/v1/auth/login"):
+    # Setamos user = {} para que os handlers possam ler request.state.user
+    # direto, sem o getattr(..., default) que paga lookup extra por request
+    if request.url.path.startswith(_PUBLIC_PREFIXES):
+        request.state.user = {}
         return await call_next(request)
 
-    # Extraímos o header Authorization
+    # Extraímos o header Authorization e validamos o esquema "Bearer <token>"
+    # startswith é uma única checagem de prefixo em C — mais barato que o
+    # split + lower de get_authorization_scheme_param em toda requisição
+    # (o fallback lowercase mantém a aceitação de "bearer" minúsculo)
     auth_header = request.headers.get("Authorization")
-    scheme, token = get_authorization_scheme_param(auth_header)
+    if not auth_header or not (
+        auth_header.startswith("Bearer ") or auth_header[:7].lower() == "bearer "
+    ):
+        return _reject_401("Token ausente ou esquema inválido")
 
-    # Verificamos se é do tipo "Bearer <token>"
-    if not token or scheme.lower() != "bearer":
-        raise HTTPException(status_code=401, detail="Token ausente ou esquema inválido")
-    
+    token = auth_header[7:]
+    if not token:
+        return _reject_401("Token ausente ou esquema inválido")
+
+    # Headers HTTP podem carregar latin-1 (bytes ≥ 0x80), mas um JWT válido é
+    # sempre ASCII → rejeitamos cedo em vez de vazar UnicodeEncodeError
     try:
-        # Lemos o header do token sem validar para extrair o "kid"
-        unverified_header = jwt.get_unverified_header(token)
+        token_bytes = token.encode("ascii")
+    except UnicodeEncodeError:
+        return _reject_401("Token inválido: caracteres não-ASCII")
+
+    # Caminho rápido: token já verificado antes e ainda dentro da validade
+    cache_key = blake2b(token_bytes, digest_size=16).digest()
+    cached = _VERIFIED.get(cache_key)
+    if cached is not None:
+        exp, claims = cached
+        if time.time() < exp:
+            # LRU de verdade: o hit renova a posição — sem isso a evicção
+            # seria FIFO e tiraria justamente os tokens mais reutilizados
+            _VERIFIED.move_to_end(cache_key)
+            request.state.user = claims
+            return await call_next(request)
+        # expirou → remove e cai na verificação completa (que rejeita com 401)
+        _VERIFIED.pop(cache_key, None)
+
+    try:
+        # Dividimos o JWS UMA vez e decodificamos só o header para extrair o "kid"
+        # (antes o token era dividido/decodificado duas vezes:
+        #  get_unverified_header + jwt.decode)
+        header_b64, payload_b64, sig_b64, signing_input = _split(token_bytes)
+        unverified_header = orjson.loads(_b64url(header_b64))
         kid = unverified_header.get("kid")
 
-        # Pegamos a chave pública correspondente
-        public_key = PUBLIC_KEYS.get(kid)
+        # Pegamos a chave pública correspondente (refresh automático em kid novo)
+        public_key = await jwks_cache.get(kid)
         if not public_key:
-            raise HTTPException(status_code=401, detail="Chave pública não encontrada")
-    
+            return _reject_401("Chave pública não encontrada")
+
         # Validamos o token com a chave pública e algoritmo RS256
-        payload = jwt.decode(token, public_key, algorithms=["RS256"])
+        # (verificação nativa via cryptography, sem o decode puro-Python do PyJWT)
+        payload = verify_rs256(signing_input, payload_b64, sig_b64, public_key)
 
         # Guardamos claims do usuários no request
         # Isso estará disponível nos handlers via request.state.user
         request.state.user = payload
-    except PyJWTError as e:
-        raise HTTPException(status_code=401, detail=f"Token inválido: {str(e)}")
+
+        # Alimenta o cache de tokens verificados (limitado a _VERIFIED_MAX)
+        _VERIFIED[cache_key] = (float(payload.get("exp", float("inf"))), payload)
+        if len(_VERIFIED) > _VERIFIED_MAX:
+            _VERIFIED.popitem(last=False)
+    except (PyJWTError, ValueError) as e:
+        # ValueError cobre base64/json inválidos no header (token corrompido)
+        return _reject_401(f"Token inválido: {str(e)}")
     
     return await call_next(request)
 
@@ -114,7 +297,24 @@ async def jwt_auth_middleware(request: Request, call_next):
 # - Como incluir roles no payload (claims customizadas)
 router = APIRouter(prefix="/v1/auth", tags=["auth"])
 
+# Carregamos a chave privada UMA vez no import, já como objeto RSAPrivateKey
+# - Passar a string PEM para jwt.encode força o PyJWT a rodar
+#   load_pem_private_key + RSA_check_key (teste de primalidade) em TODA chamada
+# - Com o objeto pronto, cada login paga apenas a assinatura RSA
+_PRIVATE_KEY_PATH = Path(settings.PRIVATE_KEY_PATH)
+_PRIVATE_KEY = load_pem_private_key(_PRIVATE_KEY_PATH.read_bytes(), password=None)
+
+# O header do JWT de login é constante → pré-codificamos o base64url no import
+# Por requisição só variam o payload e a assinatura, então o jwt.encode
+# (que re-serializa e re-codifica o header toda vez) deixa de ser necessário
+_HEADER_B64 = urlsafe_b64encode(
+    orjson.dumps({"alg": "RS256", "typ": "JWT", "kid": "test-key-1"})
+).rstrip(b"=")
+
 class LoginRequest(BaseModel):
+    # Schema estreito e imutável → validação mais rápida no pydantic-core
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     email: str
 
 @router.post("/login")
@@ -122,9 +322,6 @@ def login_mock(req: LoginRequest):
     """
     Gera um JWT assinado com o private.pem local para testes
     """
-    private_key = Path(__file__).parent.parent / "private.pem"
-    private_key = private_key.read_text()
-
     payload = {
         "sub": req.email.split("@")[0],
         "email": req.email,
@@ -133,8 +330,15 @@ def login_mock(req: LoginRequest):
         "custom:roles": ["user"]
     }
 
-    # Assinamos com algoritmo RS256 e incluímos o "kid" no header
-    token = jwt.encode(payload,private_key, algorithm="RS256", headers={"kid": "test-key-1"})
+    # Assinamos "manualmente" com RS256: header pré-codificado + payload + assinatura
+    # (mesmo formato que jwt.encode produziria, sem re-codificar o header)
+    # O digest SHA-256 do signing_input acontece dentro do sign() do OpenSSL
+    # (aceleração SHA-NI automática), nunca via hashlib do lado Python
+    payload_b64 = urlsafe_b64encode(orjson.dumps(payload)).rstrip(b"=")
+    signing_input = _HEADER_B64 + b"." + payload_b64
+    signature = _PRIVATE_KEY.sign(signing_input, PKCS1v15(), SHA256())
+    sig_b64 = urlsafe_b64encode(signature).rstrip(b"=")
+    token = (signing_input + b"." + sig_b64).decode("ascii")
     return {"access_token": token, "token_type": "Bearer"}
 
 
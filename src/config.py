@@ -2,14 +2,25 @@
 # config.py
 # --------------------------------------------------
 
+from pathlib import Path
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
+# Raiz do projeto (pasta acima de src/)
+_BASE_DIR = Path(__file__).parent.parent
+
 class Settings(BaseSettings):
     # DynamoDB
     DYNAMO_ENDPOINT: str = Field(default="http://localhost:8000", env="DYNAMO_ENDPOINT")
     DYNAMO_TABLE: str = Field(default="awsproject-store", env="DYNAMO_TABLE")
 
+    # Material de chave do "Cognito" simulado
+    # - private.pem é um artefato LOCAL (gitignored, nunca commitado)
+    # - os testes apontam os dois caminhos para um par gerado na hora
+    JWKS_PATH: str = Field(default=str(_BASE_DIR / "infra" / "jwks.json"), env="JWKS_PATH")
+    PRIVATE_KEY_PATH: str = Field(default=str(_BASE_DIR / "private.pem"), env="PRIVATE_KEY_PATH")
+
     # Constrols para testes do Circuit Breaker / fail injection
     # FORCE_FAIL_ALWAYS: se True, qualuqer prompt contendo "fail" sempre falhará
     FORCE_FAIL_ALWAYS: bool = Field(default=False, env="FORCE_FAIL_ALWAYS")
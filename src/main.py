@@ -7,26 +7,42 @@
 # - Configuramos middlewares (ex. autenticação JWT)
 # - Definimos endepoints versionados (/v1)
 # - Expomos a rota principal /generate que usa o MockProvider
+#
+# Deploy: rodar com `uvicorn src.main:app --loop uvloop --http httptools`
+# (como no Dockerfile) → event loop libuv + parser HTTP em C reduzem o
+# overhead por requisição do asyncio/h11 puros em endpoints pequenos
 # --------------------------------------------------
 
+import asyncio
+import base64
 import random
+import re
+import secrets
+import time
+from contextlib import asynccontextmanager
+
+import orjson
 
 # FastAPI → framework que usamos para expor endpoints HTTP
 # APIRouter → nos permite agrupar rotas com prefixos
 # Request → usado para acessar dados da requisição
 # Header → permite ler cabeçalhos HTTP como "Idempotency-Key"
 # HTTPException + status → usados para retornar erros padronizados
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Header, status
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Header, Query, status
 
 # Pydantic é usado para validar dados de entrada / saída da API
 # Field → adicoina restrições (ex. prompt não pode ser vazio)
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 # Tipos do Python (List, Dict, etc.) para deixar o código mais legível
 from typing import List, Dict, Any, Optional
 
-# uuid gera identificadores únicos (úteis para request_id e tracing)
-from uuid import uuid4
+# request_id: usamos timestamp (ns) em hex + sufixo aleatório em vez de uuid4
+# - uuid4 faz os.urandom(16) + formatação de UUID por requisição
+# - aqui pagamos uma leitura de relógio + os.urandom(4), bem mais barato
+# - o prefixo temporal deixa os ids ordenáveis cronologicamente (útil no /history)
+def _new_request_id() -> str:
+    return f"{time.time_ns():016x}{secrets.token_hex(4)}"
 
 # Middleware de autenticação JWT → simula AWS Cognito
 # Importamos também o router de /auth (que expõe endpoint de login)
@@ -41,7 +57,7 @@ from src.utils.sanitize import sanitize_prompt_for_logging
 from src.utils.logging_config import configure_logging
 from src.utils.idempotency import InMemoryIdempotencyStore
 from src.utils.retry import retry_async
-from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.circuit_breaker import CircuitBreakerRegistry
 
 from src.config import settings
 
@@ -56,12 +72,34 @@ log = logging.getLogger("awsProject.main")
 log.info("Start app (env=%s) FORCE_FAIL_ALWAYS=%s FORCE_FAIL_PERCENT=%s",
          settings.ENV, settings.FORCE_FAIL_ALWAYS, settings.FORCE_FAIL_PERCENT)
 
+# --------------------------------------------------
+# Lifespan: warm-up no startup
+# --------------------------------------------------
+# A PRIMEIRA requisição não deveria pagar o cold-start da infra:
+# - um DescribeTable força a criação do pool HTTPS do boto3 (DNS + TCP + TLS)
+#   e valida que a tabela existe antes de aceitar tráfego
+# - roda no thread pool (boto3 é síncrono) durante o startup do uvicorn,
+#   antes de o servidor começar a responder
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await asyncio.to_thread(
+            dynamo_repo.table.meta.client.describe_table,
+            TableName=settings.DYNAMO_TABLE
+        )
+        log.info("Warm-up: conexão com DynamoDB estabelecida (table=%s)", settings.DYNAMO_TABLE)
+    except Exception as e:
+        # Warm-up é best-effort: se o Dynamo estiver fora, o app sobe mesmo
+        # assim (o /generate já tolera falha de persistência)
+        log.warning("Warm-up do DynamoDB falhou: %s", e)
+    yield
+
 # --------------------------------------------------
 # Instancia a aplicação FastAPI
 # --------------------------------------------------
 # Aqui damos nome a versão do projeto
 # Essas informaçõess aparecem automaticamente no Swagger UI
-app = FastAPI(title = "awsProject", version = "0.1.0")
+app = FastAPI(title = "awsProject", version = "0.1.0", lifespan=lifespan)
 
 # --------------------------------------------------
 # Registra o middleware e routers
@@ -98,6 +136,10 @@ async def health():
 # - prompt é obrigatório, com tamanho entre 1 e 4000 caracteres
 # Isso previne erros e abusos (ex. prompts enormes que podem travar o sistema)
 class GenerateRequest(BaseModel):
+    # extra='forbid' → pydantic-core valida num schema mais estreito (e rejeita
+    # campos desconhecidos); frozen=True dispensa os checks de mutabilidade
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     prompt: str = Field(min_length=1, max_length=4000)
 
 # Classe que define a estrutura da resposta
@@ -118,7 +160,25 @@ mock_provider = MockProvider()
 # Infra de resiliência e idempotência (escopo do processo)
 # --------------------------------------------------
 idempotency_store = InMemoryIdempotencyStore(ttl_seconds=600) # 10 minutos
-circuit_breaker = CircuitBreaker(failure_threshold=3, recovery_time=10.0)
+
+# Breakers por dependência: o estado do provider LLM é isolado do resto
+# (um problema no Dynamo não bloqueia o tráfego do LLM, e vice-versa)
+circuit_breakers = CircuitBreakerRegistry(failure_threshold=3, recovery_time=10.0)
+_LLM_BREAKER = "mock-provider"
+
+# Gatilho de falha simulada: regex pré-compilada com alternância
+# → uma única varredura C sobre o prompt, sem lower() intermediário
+# (antes: lower() alocava uma cópia de até 4000 chars + dois scans com "in")
+_FAIL_RE = re.compile(r"fail|falha", re.IGNORECASE)
+
+# Contextos pré-computados no import do módulo
+# - As listas (e suas strings) são alocadas UMA vez, não a cada request
+# - retrieve_context vira só um teste de substring + retorno de referência
+_RAG_CONTEXT = [
+    "RAG é Retrieval Augmented Generation...",
+    "Busca contexto + gera resposta"
+]
+_NO_CONTEXT = ["Sem contexto encontrado"]
 
 def retrieve_context(prompt: str):
     """
@@ -130,13 +190,9 @@ def retrieve_context(prompt: str):
     - Isso tem a ver com enriquecer LLMs com contexto
     - Mostra como funcionaria um retrieval simples
     """
-    p = prompt.strip().lower()
-    if "rag" in p:
-        return [
-            "RAG é Retrieval Augmented Generation...",
-            "Busca contexto + gera resposta"
-        ]
-    return ["Sem contexto encontrado"]
+    if "rag" in prompt.lower():
+        return _RAG_CONTEXT
+    return _NO_CONTEXT
 
 # --------------------------------------------------
 # Endpoint /generate
@@ -159,12 +215,14 @@ async def generate(
     - Gera texto a partor de um prompt, simulando uso de LLM
     - Mostra como aplicar boas práticas de APIs (idempotência, logging, request_id)
     """
-    user_claims = getattr(request.state, "user", {})
+    # O middleware sempre popula request.state.user (claims ou {} em rota pública)
+    # → acesso direto, sem getattr com default
+    user_claims = request.state.user
     if not user_claims:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing or invalid token")
 
     # Gera identificador único para rastrear a requisição
-    request_id = str(uuid4())
+    request_id = _new_request_id()
 
     # Sanitiza prompt (remove emails / tokens antes de logar)
     sanitized = sanitize_prompt_for_logging(req.prompt)
@@ -182,142 +240,207 @@ async def generate(
     # Idempotency-Key
     # -------------------------
     lock = None
-    incoming_body = req.model_dump()  # pydantic v2; se v1, use req.dict()
-    incoming_hash = idempotency_store.body_hash(incoming_body)
-
     if idempotency_key:
+        # Serialização + hash do corpo só são necessários quando o cliente
+        # envia Idempotency-Key — no caminho comum (sem a chave) não pagamos nada
+        # model_dump_json serializa direto para JSON no pydantic-core (Rust);
+        # os MESMOS bytes alimentam o hash e o store, sem round-trip por dict
+        incoming_body = req.model_dump_json().encode("utf-8")
+        incoming_hash = idempotency_store.body_hash(incoming_body)
+
         # lock por chave para evitar corrida entre requisições simultâneas
         lock = await idempotency_store.acquire_lock(idempotency_key)
-        cached = idempotency_store.get_entry(idempotency_key)
-        if cached:
-            if cached["body_hash"] != incoming_hash:
-                #mesma chave com corpo diferente -> 409
-                if lock:
-                    lock.release()
-                raise HTTPException(
-                    status_code = status.HTTP_409_CONFLICT,
-                    detail = "Idempotency-Key reuse with different request body"
-                )
-            # replay: retorna a mesma resposta sem reprocessar
-            response.headers["Idempotency-Replay"] = "true"
-            log.info("idempotent replay request_id=%s key=%s", request_id, idempotency_key)
-            if lock:
-                lock.release()
-            return cached["data"]
-
-    # Simula busca de contexto (mini-RAG)
-    context = retrieve_context(req.prompt) # RAG dummy → busca contexto estático
-
-    # -------------------------
-    # Circuit breaker: bloqueia se o upstream estiver ruim
-    # -------------------------
-    allowed = await circuit_breaker.allow_request()
-    if not allowed:
-        log.warning("circuit open request_id=%s", request_id)
-        raise HTTPException(
-            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail = f"Upstream LLM temporarily unavailable (circuit open, request_id={request_id})"
-        )
-    
-    # Para treino: se o prompt contiver 'fail', simulamos falha transitória
-    # O comportamento é controlado por configurações
-    # - se settings.FORCE_FAIL_ALWAYS é TRUE -> sempre falha quando "fail" está no prompt
-    # - caso contrário, falha com probabilidade settings.FORCE_FAIL_PERCENT
-    prompt_lower = req.prompt.lower()
-    if "fail" in prompt_lower or "falha" in prompt_lower:
-        if settings.FORCE_FAIL_ALWAYS:
-            should_fail = True
-        else:
-            should_fail = (random.random() < float(settings.FORCE_FAIL_PERCENT))
-    else:
-        should_fail = False
-
-    async def call_provider():
-        if should_fail and random.random() < 0.7:
-            raise RuntimeError("Injected transient failure (simulated)")
-        return await mock_provider.generate_text(
-            f"Contexto: {' '.join(context)} | Pergunta: {req.prompt}"
-        )
-    
-    try:
-        generated_text = await retry_async(
-            call_provider,
-            attempts=3,
-            min_delay=0.2,
-            max_delay=1.5,
-            exceptions=(Exception,),
-            jitter=True
-        )
-        await circuit_breaker.on_success()
-    except Exception:
-        await circuit_breaker.on_failure()
-        log.exception("Provider error (after retry) request_id=%s", request_id)
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail=f"upstream error (request_id={request_id})"
-        )
-
-    # Montamos a resposta final
-    result = {
-        "generated": generated_text,
-        "context": context,
-        "user": user_claims,
-        "request_id": request_id
-    }
 
+    # Daqui para baixo o lock (se houver) fica protegido por try/finally:
+    # QUALQUER saída — replay, 409, 502/503, exceção inesperada — o libera
+    # Antes, um erro com Idempotency-Key deixava o lock preso para sempre e
+    # todos os retries com a mesma chave esperavam eternamente
     try:
-        dynamo_repo.save_item(
-            user_id=user_claims.get("sub"),
-            request_id=request_id,
-            prompt=req.prompt,
-            response=result
-        )
-    except Exception as e:
-        log.error("Erro ao salvar no DynamoDB request_id=%s user=%s: %s",
-                  request_id, user_claims.get("sub"), str(e))
-        # Não lançamos erro para o usuário → a geração funciona mesmo sem salvar
-
-    if idempotency_key:
-        idempotency_store.put(idempotency_key, incoming_body, result)
-        response.headers["Idempotency-Replay"] = "false"
-        if lock:
+        if idempotency_key:
+            cached = idempotency_store.get_entry(idempotency_key)
+            if cached:
+                if cached["body_hash"] != incoming_hash:
+                    #mesma chave com corpo diferente -> 409
+                    raise HTTPException(
+                        status_code = status.HTTP_409_CONFLICT,
+                        detail = "Idempotency-Key reuse with different request body"
+                    )
+                # replay: retorna a mesma resposta sem reprocessar
+                # O store só guarda a referência (user_id, request_id); a resposta
+                # vem do cache quente ou, se já saiu dele, do Dynamo (GetItem)
+                data = cached["data"]
+                if data is None:
+                    ref_user, ref_request = cached["ref"]
+                    item = await dynamo_repo.get_item(ref_user, ref_request)
+                    data = item.get("response") if item else None
+                if data is not None:
+                    response.headers["Idempotency-Replay"] = "true"
+                    log.info("idempotent replay request_id=%s key=%s", request_id, idempotency_key)
+                    return data
+                # Dynamo também não tem a resposta → reprocessa como nova
+
+        # Simula busca de contexto (mini-RAG)
+        context = retrieve_context(req.prompt) # RAG dummy → busca contexto estático
+
+        # -------------------------
+        # Circuit breaker: bloqueia se o upstream estiver ruim
+        # -------------------------
+        allowed = circuit_breakers.allow(_LLM_BREAKER)
+        if not allowed:
+            log.warning("circuit open request_id=%s", request_id)
+            raise HTTPException(
+                status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail = f"Upstream LLM temporarily unavailable (circuit open, request_id={request_id})"
+            )
+
+        # Para treino: se o prompt contiver 'fail', simulamos falha transitória
+        # O comportamento é controlado por configurações
+        # - se settings.FORCE_FAIL_ALWAYS é TRUE -> sempre falha quando "fail" está no prompt
+        # - caso contrário, falha com probabilidade settings.FORCE_FAIL_PERCENT
+        if _FAIL_RE.search(req.prompt):
+            if settings.FORCE_FAIL_ALWAYS:
+                should_fail = True
+            else:
+                should_fail = (random.random() < float(settings.FORCE_FAIL_PERCENT))
+        else:
+            should_fail = False
+
+        async def call_provider():
+            if should_fail and random.random() < 0.7:
+                raise RuntimeError("Injected transient failure (simulated)")
+            return await mock_provider.generate_text(
+                f"Contexto: {' '.join(context)} | Pergunta: {req.prompt}"
+            )
+
+        try:
+            generated_text = await retry_async(
+                call_provider,
+                attempts=3,
+                min_delay=0.2,
+                max_delay=1.5,
+                exceptions=(Exception,),
+                jitter=True,
+                # orçamento TOTAL de retry: num surto de falhas, nenhuma
+                # requisição segura coroutine (e lock de idempotência) por
+                # mais que ~5s antes de responder 502
+                deadline=5.0
+            )
+            circuit_breakers.on_success(_LLM_BREAKER)
+        except Exception:
+            circuit_breakers.on_failure(_LLM_BREAKER)
+            log.exception("Provider error (after retry) request_id=%s", request_id)
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"upstream error (request_id={request_id})"
+            )
+
+        # Montamos a resposta final
+        result = {
+            "generated": generated_text,
+            "context": context,
+            "user": user_claims,
+            "request_id": request_id
+        }
+
+        try:
+            await dynamo_repo.save_item(
+                user_id=user_claims.get("sub"),
+                request_id=request_id,
+                prompt=req.prompt,
+                response=result
+            )
+        except Exception as e:
+            log.error("Erro ao salvar no DynamoDB request_id=%s user=%s: %s",
+                      request_id, user_claims.get("sub"), str(e))
+            # Não lançamos erro para o usuário → a geração funciona mesmo sem salvar
+
+        if idempotency_key:
+            idempotency_store.put(
+                idempotency_key,
+                incoming_body,
+                (user_claims.get("sub"), request_id),
+                result
+            )
+            response.headers["Idempotency-Replay"] = "false"
+
+        return result
+    finally:
+        if lock is not None:
             lock.release()
 
-    return result
-
 # --------------------------------------------------
 # Endpoint /history
 # --------------------------------------------------
+# Cursor opaco de paginação: o LastEvaluatedKey do Dynamo vira um token
+# base64 que o cliente devolve na próxima página → paginação stateless
+def _encode_cursor(key: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(key)).decode("ascii")
+
+def _decode_cursor(token: str) -> Dict[str, Any]:
+    return orjson.loads(base64.urlsafe_b64decode(token))
+
 @v1.get("/history")
 async def history(
     request: Request,
-    limit: int = 10 # opcional: permite limitar resultados
+    # limit validado na borda: 0/negativo viravam ParamValidationError do
+    # botocore (500); teto de 100 evita páginas gigantes num único query
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None # token opaco da página anterior
 ):
     """
-    Lista histórico de prompts/respostas de um usuário
+    Lista histórico de prompts/respostas de um usuário, paginado
     - Protegido por JWT (precisa token válido)
-    - Usa DynamoRepository.list_items()
+    - Usa DynamoRepository.list_items() com Limit + ExclusiveStartKey
+    - Retorna {"items": [...], "next_cursor": token|null}; o cliente devolve
+        next_cursor para buscar a próxima página (custo O(página), não O(histórico))
     """
-    user_claims = getattr(request.state, "user", {})
+    user_claims = request.state.user
     if not user_claims:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Missing or invalid token"
         )
-    
+
+    start_key = None
+    if cursor:
+        try:
+            start_key = _decode_cursor(cursor)
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor inválido"
+            )
+        # O token precisa ser exatamente uma LastEvaluatedKey desta tabela
+        # E pertencer ao próprio usuário autenticado: um user_id alheio não
+        # daria erro visível — o Dynamo rejeitaria e a página voltaria vazia
+        # em silêncio (ou, pior, paginaria o histórico de outro usuário)
+        if (
+            not isinstance(start_key, dict)
+            or set(start_key) != {"user_id", "request_id"}
+            or not all(isinstance(v, str) for v in start_key.values())
+            or start_key["user_id"] != user_claims.get("sub")
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor inválido"
+            )
+
     user_id = user_claims.get("sub")
     try:
-        items = dynamo_repo.list_items(user_id)
+        items, last_key = await dynamo_repo.list_items(user_id, limit=limit, cursor=start_key)
     except Exception as e:
         log.error("Erro ao buscar histórico no Dynamo user=%s: %s", user_id, str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erro ao buscar histórico"
         )
-    
-    # Ordena por request_id ou por tempo, se tivermos
-    items_sorted = sorted(items, key=lambda x: x.get("request_id"), reverse=True)
-    return items_sorted[:limit]
+
+    # O Dynamo já devolve mais recentes primeiro (ScanIndexForward=False)
+    # → sem sort em Python sobre a página
+    return {
+        "items": items,
+        "next_cursor": _encode_cursor(last_key) if last_key else None
+    }
 
 # --------------------------------------------------
 # Registrar router no app principal
@@ -24,6 +24,16 @@ from .base import LLMProvider
 # Em termos de aprendizado
 # - Como aplicar o uso de abstração (programar contra interface, não implementação)
 # - COmo manter código desacoplado para trocar providers facilmente
+# Templates pré-definidos no import do módulo
+# - Apenas UM deles é formatado por chamada (escolhemos o índice primeiro)
+# - Antes montávamos uma lista com as 4 strings já formatadas e descartávamos 3
+_TEMPLATES = (
+    "Entendi que você quer saber sobre {}",
+    "Posso explicar isso de forma simples: {}",
+    "Aqui está uma resposta simulada para {}",
+    "Simulação: {} - resposta fictícia",
+)
+
 class MockProvider(LLMProvider):
     """
     MockProvider implementa generate_text de forma assíncrona,
@@ -43,11 +53,6 @@ class MockProvider(LLMProvider):
         Gera uma resposta simulada a partir de um prompt
         EM produção, aqui chamaríamos o LLM real (ex. Bedrock, OpenAI)
         """
-        respostas = [
-            f"Entendi que você quer saber sobre {prompt}",
-            f"Posso explicar isso de forma simples: {prompt}",
-            f"Aqui está uma resposta simulada para {prompt}",
-            f"Simulação: {prompt} - resposta fictícia"
-        ]
-        # Escolhemos uma resposta aleatória → simula variação de modelos reais
-        return random.choice(respostas)
\ No newline at end of file
+        # Escolhemos o template aleatório primeiro e formatamos SÓ ele
+        # → simula variação de modelos reais sem pagar 4 formatações por chamada
+        return _TEMPLATES[random.randrange(4)].format(prompt)
\ No newline at end of file
@@ -13,10 +13,16 @@
 # - Depois podemos consultar histórico por usuário ou por request_id
 # --------------------------------------------------
 
+import asyncio
 import boto3
 import logging
+import orjson
+import random
+import time
+from functools import lru_cache
 from typing import Dict, Any, Optional
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 from src.config import settings
@@ -28,6 +34,111 @@ except ImportError:
 
 log = logging.getLogger("awsProject.dynamo")
 
+# --------------------------------------------------
+# Factories memoizadas de resource/table
+# --------------------------------------------------
+# Construir um client/resource boto3 é caro (descoberta de endpoint, carga de
+# modelos de serviço, resolução de credenciais) — na casa de centenas de ms
+# Com lru_cache, o custo é pago UMA vez por processo; instanciar vários
+# DynamoRepository (ex. um por request via DI) reusa o mesmo resource,
+# o mesmo Table e o mesmo pool de conexões HTTPS por baixo
+
+# Config compartilhada: pool de conexões maior (reuso de TCP/TLS entre
+# requisições concorrentes) + retries adaptativos do botocore
+_BOTO_CONFIG = Config(max_pool_connections=50, retries={"mode": "adaptive"})
+
+@lru_cache(maxsize=None)
+def _get_resource(env: str, endpoint: str, region: str):
+    """Cria (uma vez) o resource DynamoDB para o ambiente"""
+    if env == "dev":
+        # Em dev o endpoint vem do moto (mock) → sem endpoint_url explícito
+        return boto3.resource("dynamodb", region_name=region, config=_BOTO_CONFIG)
+    return boto3.resource(
+        "dynamodb",
+        endpoint_url=endpoint,
+        region_name=region,
+        aws_access_key_id="fake", # credenciais fake para rodar local
+        aws_secret_access_key="fake",
+        config=_BOTO_CONFIG
+    )
+
+@lru_cache(maxsize=None)
+def _get_table(env: str, endpoint: str, region: str, table_name: str):
+    """Cria (uma vez) o objeto Table — evita o dispatch de Table() por instância"""
+    return _get_resource(env, endpoint, region).Table(table_name)
+
+@lru_cache(maxsize=None)
+def _get_client(env: str, endpoint: str, region: str):
+    """
+    Client low-level (uma vez) para os writes quentes
+    - NÃO pode ser o resource.meta.client: esse carrega o transform de
+        documento do boto3 e re-serializaria o item já em attribute-value
+    """
+    if env == "dev":
+        return boto3.client("dynamodb", region_name=region, config=_BOTO_CONFIG)
+    return boto3.client(
+        "dynamodb",
+        endpoint_url=endpoint,
+        region_name=region,
+        aws_access_key_id="fake",
+        aws_secret_access_key="fake",
+        config=_BOTO_CONFIG
+    )
+
+# Estado de dev compartilhado entre instâncias do repositório
+# - O mock do moto é iniciado UMA vez por processo (cada start() extra em
+#   N repositórios era patching redundante)
+# - _TABLES_ENSURED evita repetir o list_tables (um round-trip de API
+#   completo, mesmo no moto) para tabelas já verificadas
+_MOCK = None
+_TABLES_ENSURED: set[str] = set()
+
+# Reenvio de UnprocessedItems no BatchWriteItem
+# - Eles chegam em respostas 200 → os retries adaptativos do botocore NÃO se
+#   aplicam; sem pausa própria o loop viraria busy-loop contra uma tabela
+#   já throttled
+# - Backoff exponencial com full jitter e limite de tentativas
+_BATCH_MAX_RETRIES = 5
+_BATCH_BASE_DELAY = 0.1 # segundos
+_BATCH_MAX_DELAY = 2.0
+
+# Serializador/deserializador attribute-value compartilhados
+# (stateless → seguros no módulo)
+# O Table do resource instancia um TypeSerializer e reflete o item inteiro a
+# CADA put_item; com o schema fixo daqui dá para montar o formato low-level
+# direto e chamar o client, pulando o dispatch Python da camada resource
+# IMPORTANTE: os métodos públicos rodam em threads do pool (asyncio.to_thread)
+# e o boto3 só documenta CLIENTS como thread-safe — resources/Table não são
+# → todo o caminho de dados usa self._client; o resource fica restrito ao
+# bootstrap de dev (_ensure_table), que roda uma vez no __init__
+_SER = TypeSerializer()
+_serialize = _SER.serialize
+_DES = TypeDeserializer()
+_deserialize = _DES.deserialize
+
+def _from_av(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte um item attribute-value do client para um dict Python plano"""
+    return {k: _deserialize(v) for k, v in item.items()}
+
+# O campo "response" é gravado como JSON canônico (string), não como mapa
+# attribute-value: o round-trip do TypeSerializer transforma números em
+# Decimal/string na volta, e o replay idempotente promete a MESMA resposta
+# byte a byte — orjson.loads(orjson.dumps(x)) preserva int/float/bool exatos
+def _item_to_av(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Serializa um item plano para attribute-value, com response como JSON"""
+    return {
+        k: {"S": orjson.dumps(v).decode()} if k == "response" else _serialize(v)
+        for k, v in item.items()
+    }
+
+def _item_from_av(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Deserializa um item do client, decodificando response de volta a dict"""
+    plain = _from_av(item)
+    resp = plain.get("response")
+    if isinstance(resp, str):
+        plain["response"] = orjson.loads(resp)
+    return plain
+
 class DynamoRepository:
     """
     Repositório de persistência em DynamoDB
@@ -43,30 +154,33 @@ class DynamoRepository:
         Inicializa o  cliente apontando para DynamoDB
         - Pode ser AWS real ou DynamoDB Local (via settings.DYNAMO_ENDPOINT)
         """
+        global _MOCK
         if settings.ENV == "dev":
             if not mock_dynamodb:
                 raise RuntimeError("Moto não está instalado — necessário para rodar em modo dev/test")
-            log.info("Iniciando DynamoDB simulado em moto")
-            self.mock = mock_dynamodb()
-            self.mock.start()
-            self.dynamo = boto3.resource("dynamodb", region_name="us-east-1")
+            if _MOCK is None:
+                log.info("Iniciando DynamoDB simulado em moto")
+                _MOCK = mock_dynamodb()
+                _MOCK.start()
+            self.mock = _MOCK
+            self.dynamo = _get_resource("dev", settings.DYNAMO_ENDPOINT, "us-east-1")
             self._ensure_table()
         else:
             log.info("Conectando ao DynamoDB real")
-            self.dynamo = boto3.resource(
-                "dynamodb",
-                endpoint_url=settings.DYNAMO_ENDPOINT,
-                region_name="us-east-1", # default (mock), pode vir do settings também
-                aws_access_key_id="fake", # credenciais fake para rodar local
-                aws_secret_access_key="fake"
-            )
-        
-        self.table = self.dynamo.Table(settings.DYNAMO_TABLE)
+            self.dynamo = _get_resource(settings.ENV, settings.DYNAMO_ENDPOINT, "us-east-1")
+
+        self.table = _get_table(settings.ENV, settings.DYNAMO_ENDPOINT,
+                                "us-east-1", settings.DYNAMO_TABLE)
+        self._client = _get_client(settings.ENV, settings.DYNAMO_ENDPOINT, "us-east-1")
     
     def _ensure_table(self):
         """
         Cria tabela automaticamente se não existir (apenas em dev)
+        - Resultado cacheado por processo: repositórios subsequentes não
+            repetem o list_tables
         """
+        if settings.DYNAMO_TABLE in _TABLES_ENSURED:
+            return
         existing_tables = self.dynamo.meta.client.list_tables()["TableNames"]
         if settings.DYNAMO_TABLE not in existing_tables:
             self.dynamo.create_table(
@@ -82,57 +196,160 @@ class DynamoRepository:
                 BillingMode="PAY_PER_REQUEST",
             )
             log.info("Tabela %s criada (simulada)", settings.DYNAMO_TABLE)
+        _TABLES_ENSURED.add(settings.DYNAMO_TABLE)
+
+    # ------------------------------------------------------------------
+    # API assíncrona
+    # ------------------------------------------------------------------
+    # boto3 é síncrono: cada chamada bloquearia o event loop pelo RTT inteiro,
+    # serializando TODOS os handlers concorrentes do FastAPI
+    # Os métodos públicos são async e despacham o trabalho bloqueante para o
+    # thread pool (asyncio.to_thread) → o loop segue atendendo outras requisições
+    # enquanto o Dynamo responde
+    # (aioboto3 seria o drop-in "nativo", mas não vale uma dependência nova +
+    #  uma segunda stack HTTP só para isso; o thread pool resolve o bloqueio)
+    async def save_item(self, user_id: str, request_id: str, prompt: str, response: Dict[str, Any]) -> None:
+        """Versão async de _save_item_sync (não bloqueia o event loop)"""
+        await asyncio.to_thread(self._save_item_sync, user_id, request_id, prompt, response)
 
-    def save_item(self, user_id: str, request_id: str, prompt: str, response: Dict[str, Any]) -> None:
+    async def save_items(self, items: list[Dict[str, Any]]) -> None:
+        """Versão async de _save_items_sync (não bloqueia o event loop)"""
+        await asyncio.to_thread(self._save_items_sync, items)
+
+    async def get_item(self, user_id: str, request_id: str) -> Optional[Dict[str, Any]]:
+        """Versão async de _get_item_sync (não bloqueia o event loop)"""
+        return await asyncio.to_thread(self._get_item_sync, user_id, request_id)
+
+    async def list_items(
+        self,
+        user_id: str,
+        limit: int = 25,
+        cursor: Optional[Dict[str, Any]] = None
+    ) -> tuple[list[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Versão async de _list_items_sync (não bloqueia o event loop)"""
+        return await asyncio.to_thread(self._list_items_sync, user_id, limit, cursor)
+
+    # ------------------------------------------------------------------
+    # Implementações síncronas (rodam no thread pool)
+    # ------------------------------------------------------------------
+    def _save_item_sync(self, user_id: str, request_id: str, prompt: str, response: Dict[str, Any]) -> None:
         """
         Salva no DynamoDB um histórico de geração
         - user_id → quem fez a chamada
         - request_id → identificador único (permite buscar depois)
         - prompt → entrada original do usuário
-        - response → saída gerada (JSON serializável)
+        - response → saída gerada (JSON serializável), gravada como JSON
+            canônico para round-trip exato no replay idempotente
         """
 
         item = {
-            "user_id": user_id,
-            "request_id": request_id,
-            "prompt": prompt,
-            "response": response
+            "user_id": {"S": user_id},
+            "request_id": {"S": request_id},
+            "prompt": {"S": prompt},
+            "response": {"S": orjson.dumps(response).decode()}
         }
         try:
-            self.table.put_item(Item=item)
-            log.info("Saved request_id=%s user_id=%s into DynamoDB", request_id, user_id)
+            self._client.put_item(TableName=settings.DYNAMO_TABLE, Item=item)
+            # Log por escrita é caminho quente → só em DEBUG, com guarda para
+            # nem montar o LogRecord quando o nível está filtrado
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Saved request_id=%s user_id=%s into DynamoDB", request_id, user_id)
         except ClientError as e:
             log.error("DynamoDB put_item error: %s", e)
             raise
 
-    def get_item(self, user_id: str, request_id: str) -> Optional[Dict[str, Any]]:
+    def _save_items_sync(self, items: list[Dict[str, Any]]) -> None:
+        """
+        Salva vários históricos de uma vez via BatchWriteItem (client low-level)
+        - Colapsa N put_item (N round-trips HTTP/TLS) em lotes de até 25 itens
+        - UnprocessedItems (devolvidos em respostas 200, fora do alcance dos
+            retries do botocore) são reenviados com backoff exponencial +
+            jitter, até _BATCH_MAX_RETRIES
+        - Deduplicamos por (user_id, request_id) antes do envio — o
+            BatchWriteItem rejeita chaves repetidas no mesmo lote
+        Cada item deve ter as mesmas chaves usadas em save_item
+        """
+        # último item de cada chave vence (mesma semântica do overwrite_by_pkeys)
+        unique = {(it["user_id"], it["request_id"]): it for it in items}
+        put_requests = [
+            {"PutRequest": {"Item": _item_to_av(it)}}
+            for it in unique.values()
+        ]
+        try:
+            for i in range(0, len(put_requests), 25):
+                pending = {settings.DYNAMO_TABLE: put_requests[i:i + 25]}
+                attempt = 0
+                while pending:
+                    resp = self._client.batch_write_item(RequestItems=pending)
+                    pending = resp.get("UnprocessedItems") or None
+                    if pending:
+                        attempt += 1
+                        if attempt > _BATCH_MAX_RETRIES:
+                            log.error(
+                                "DynamoDB batch_write: %d itens não processados após %d tentativas",
+                                len(pending[settings.DYNAMO_TABLE]), _BATCH_MAX_RETRIES
+                            )
+                            raise RuntimeError("BatchWriteItem: UnprocessedItems persistentes")
+                        # full jitter: sorteia em [0, min(base * 2^n, teto)]
+                        time.sleep(random.uniform(
+                            0, min(_BATCH_BASE_DELAY * (2 ** attempt), _BATCH_MAX_DELAY)
+                        ))
+            log.info("Saved %d items into DynamoDB (batch)", len(put_requests))
+        except ClientError as e:
+            log.error("DynamoDB batch_write error: %s", e)
+            raise
+
+    def _get_item_sync(self, user_id: str, request_id: str) -> Optional[Dict[str, Any]]:
         """
         Recupera um item específico (usuário + request_id)
         - Útil para reprocessar ou debugar chamadas antigas
         """
         try:
-            resp = self.table.get_item(
+            resp = self._client.get_item(
+                TableName=settings.DYNAMO_TABLE,
                 Key={
-                    "user_id": user_id,
-                    "request_id": request_id
+                    "user_id": {"S": user_id},
+                    "request_id": {"S": request_id}
                 }
             )
-            return resp.get("Item")
+            item = resp.get("Item")
+            return _item_from_av(item) if item else None
         except ClientError as e:
             log.error("DynamoDB get_item error: %s", e)
             return None
         
-    def list_items(self, user_id: str) -> list[Dict[str, Any]]:
+    def _list_items_sync(
+        self,
+        user_id: str,
+        limit: int = 25,
+        cursor: Optional[Dict[str, Any]] = None
+    ) -> tuple[list[Dict[str, Any]], Optional[Dict[str, Any]]]:
         """
-        Lista todo histórico de prompts de um usuário
-        - Exemplo: usuário quer ver últimos 10 prompts enviados
-        - Útil em dashboards e debugging
+        Lista o histórico de prompts de um usuário, paginado
+        - limit → tamanho máximo da página (antes a query era ILIMITADA e
+            materializava TODO o histórico em memória a cada chamada)
+        - cursor → LastEvaluatedKey da página anterior (None = primeira página)
+        - ScanIndexForward=False → mais recentes primeiro (request_id é ordenável
+            cronologicamente)
+        Retorna (items, next_cursor); next_cursor=None quando não há mais páginas
+        O custo por chamada vira O(página) em vez de O(histórico inteiro)
         """
         try:
-            resp = self.table.query(
-                KeyConditionExpression=Key("user_id").eq(user_id)
-            )
-            return resp.get("Items", [])
+            kwargs: Dict[str, Any] = {
+                "TableName": settings.DYNAMO_TABLE,
+                "KeyConditionExpression": "user_id = :uid",
+                "ExpressionAttributeValues": {":uid": {"S": user_id}},
+                "Limit": limit,
+                "ScanIndexForward": False,
+            }
+            if cursor:
+                # o cursor externo fica no formato plano (dict de strings);
+                # a conversão attribute-value é detalhe interno do client
+                kwargs["ExclusiveStartKey"] = {k: _serialize(v) for k, v in cursor.items()}
+            resp = self._client.query(**kwargs)
+            items = [_item_from_av(i) for i in resp.get("Items", [])]
+            last_key = resp.get("LastEvaluatedKey")
+            return items, _from_av(last_key) if last_key else None
         except ClientError as e:
             log.error("DynamoDB query error: %s", e)
-            return []
\ No newline at end of file
+            return [], None
\ No newline at end of file
@@ -17,7 +17,6 @@
 
 
 import time
-import asyncio
 
 class CircuitBreaker:
     def __init__(self, failure_threshold: int = 3, recovery_time: float = 10.0):
@@ -27,6 +26,10 @@ class CircuitBreaker:
         """
         self.failure_threshold = failure_threshold
         self.recovery_time = recovery_time
+        # Pré-convertido para ns: a comparação no caminho quente vira
+        # aritmética de inteiros pura (monotonic_ns é uma leitura vDSO que
+        # devolve int, sem a conversão para float de time.time/monotonic)
+        self.recovery_time_ns = int(recovery_time * 1e9)
 
         # Estado inicial → aceita tudo
         self.state = "CLOSED"
@@ -35,60 +38,100 @@ class CircuitBreaker:
         self.fail_count = 0
 
         # Quando o circuito abriu (para saber se já passou recovery_time)
-        self.opened_at = 0.0
+        # monotonic_ns → imune a saltos do relógio de parede (NTP)
+        self.opened_at_ns = 0
 
-        # Lock assíncrono → garante que várias coroutines não mudem o estado ao mesmo tempo
-        self._lock = asyncio.Lock()
+        # Nota sobre concorrência: os métodos abaixo são atribuições simples de
+        # int/str SEM nenhum await no meio — no asyncio (single-thread) cada
+        # método roda de forma atômica do ponto de vista das coroutines
+        # O asyncio.Lock que existia aqui só pagava agendamento do event loop
+        # sem proteger nada; locks assíncronos só se justificam quando a seção
+        # crítica atravessa um await
 
     # --------------------------------------------------
     # Consulta se pode processaR a requisição
     # --------------------------------------------------
-    async def allow_request(self) -> bool:
+    def allow_request(self) -> bool:
         """
         Retorna TRUE se a requisição pode seguir, False se deve ser bloqueada
         - CLOSED: sempre True
         - OPEN: False, a menos que já tenha passado o recovery_time → vira HALF_OPEN
         - HALF_OPEN: True (permite uma tentativa de teste)
         """
-        async with self._lock:
-            if self.state == "OPEN":
-                # Está bloqueado → verifica se já deu tempo para tentar de novo
-                if time.time() - self.opened_at >= self.recovery_time:
-                    self.state = "HALF_OPEN"
-                    return True
-                return False
-            return True # CLOSED ou HALF_OPEN permitem tentativa
+        if self.state == "OPEN":
+            # Está bloqueado → verifica se já deu tempo para tentar de novo
+            if time.monotonic_ns() - self.opened_at_ns >= self.recovery_time_ns:
+                self.state = "HALF_OPEN"
+                return True
+            return False
+        return True # CLOSED ou HALF_OPEN permitem tentativa
 
     # --------------------------------------------------
     # Atualiza estado em caso de sucesso
     # --------------------------------------------------
-    async def on_success(self):
+    def on_success(self):
         """
         Chamado quando a requisição foi bem sucedida
         - Zera o contador de falhas
         - Fecha o circuito (volta para CLOSED)
         """
-        async with self._lock:
-            self.fail_count = 0
-            self.state = "CLOSED"
+        self.fail_count = 0
+        self.state = "CLOSED"
 
     # --------------------------------------------------
     # Atualiza estado em caso de falha
     # --------------------------------------------------
-    async def on_failure(self):
+    def on_failure(self):
         """
         Chamado quando a requisição falhou
         - Se estava HALF_OPEN → volta a OPEN imediatamente
         - Se acumulou falhas >= threshold → abre o circuito (OPEN)
         """
-        async with self._lock:
-            self.fail_count += 1
-            if self.state == "HALF_OPEN":
-                # falou no teste -> volta a OPEN
-                self.state = "OPEN"
-                self.opened_at = time.time()
-                return
-            if self.fail_count >= self.failure_threshold:
-                # Muitas falhas consecutivas → abre o circuito
-                self.state = "OPEN"
-                self.opened_at = time.time()
\ No newline at end of file
+        self.fail_count += 1
+        if self.state == "HALF_OPEN":
+            # falou no teste -> volta a OPEN
+            self.state = "OPEN"
+            self.opened_at_ns = time.monotonic_ns()
+            return
+        if self.fail_count >= self.failure_threshold:
+            # Muitas falhas consecutivas → abre o circuito
+            self.state = "OPEN"
+            self.opened_at_ns = time.monotonic_ns()
+# --------------------------------------------------
+# Registro de breakers por dependência (sharding)
+# --------------------------------------------------
+# Um único CircuitBreaker global mistura falhas de dependências independentes:
+# um soluço no DynamoDB abriria o circuito também para o LLM, e todo o
+# tráfego concorrente disputa o mesmo estado
+# Com um breaker por chave ("mock-provider", "dynamo", "bedrock:<model>"),
+# cada downstream abre e fecha sozinho, sem contenção entre eles
+class CircuitBreakerRegistry:
+    def __init__(self, failure_threshold: int = 3, recovery_time: float = 10.0):
+        """
+        failure_threshold / recovery_time: defaults aplicados aos breakers criados
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def _get(self, key: str) -> CircuitBreaker:
+        """Retorna (criando sob demanda) o breaker da dependência"""
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            # setdefault é atômico sob o GIL → sem corrida na criação
+            breaker = self._breakers.setdefault(
+                key, CircuitBreaker(self.failure_threshold, self.recovery_time)
+            )
+        return breaker
+
+    def allow(self, key: str) -> bool:
+        """Consulta se a dependência pode receber a requisição"""
+        return self._get(key).allow_request()
+
+    def on_success(self, key: str):
+        """Registra sucesso na dependência"""
+        self._get(key).on_success()
+
+    def on_failure(self, key: str):
+        """Registra falha na dependência"""
+        self._get(key).on_failure()
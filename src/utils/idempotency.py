@@ -9,7 +9,7 @@
 #
 # Como funciona
 # - Mantemos um dicionário em memória que guarda
-#   { chave: (timestamp, bodyhash, data) }
+#   { chave: (timestamp, bodyhash, ref) }
 # - TTL: cada entrada expira após x segundos → evita crescer para sempre
 # - body_hash: impede reuso da mesma chave com payload diferentes (409)
 # - locks: evitam corrida (duas requisições com a mesm chave ao mesmo tempo)
@@ -21,9 +21,11 @@
 # - Demonstra uma prática muito comum em APIs de produção
 
 import time
-import json
 import hashlib
 import asyncio
+
+import orjson
+from collections import OrderedDict
 from typing import Any, Dict, Optional, Tuple
 
 class InMemoryIdempotencyStore:
@@ -31,92 +33,174 @@ class InMemoryIdempotencyStore:
     Implementação simples de um cacho em memória para gerenciar Idempotency-Key
     Útil para garantir que requisiões repetidas não causem duplicidade de efeitos
     """
-    def __init__(self, ttl_seconds: int = 600):
+    def __init__(self, ttl_seconds: int = 600, max_entries: int = 10000, hot_entries: int = 100):
         """
         ttl_seconds: tempo de vida (em segundos) de cada chave
         - Ex.: se ttl=600, após 10 minutos a chave expira e pode ser reutilizada
+        max_entries: teto de chaves residentes (LRU: estourou → sai a mais antiga)
+        - Sem teto, chaves que nunca são consultadas de novo ficariam
+            residentes para sempre (leak de memória entre sweeps)
+        hot_entries: teto do cache quente de respostas completas
+        - O store principal só guarda a REFERÊNCIA (user_id, request_id);
+            a resposta canônica já vive no Dynamo e é rehidratada no replay
+        - Guardar o dict inteiro por chave (dezenas de KB num payload de
+            chat) inflava o RSS do processo durante todo o TTL
         """
         self.ttl = ttl_seconds
+        # TTL pré-convertido para ns → comparações de expiração viram
+        # aritmética de inteiros sobre monotonic_ns (sem float e imune a
+        # saltos de relógio NTP, que podiam esticar ou encurtar TTLs)
+        self.ttl_ns = ttl_seconds * 1_000_000_000
+        self.max_entries = max_entries
         
-        # Dicionário principal
-        # key -> (timestamp, body_hash, data)
-        #   timestamp: quando a entrada foi criada
-        #   body_hash: hash do corpo da requisição (para detectar conflitos)
-        #   data: a resposta já processada (para replay)
-        self._store: Dict[str, Tuple[float, str, Dict[str, Any]]] = {}
+        self.hot_entries = hot_entries
+
+        # Dicionário principal (OrderedDict → ordem de inserção ≈ idade)
+        # key -> (timestamp, body_hash, ref)
+        #   timestamp: quando a entrada foi criada (monotonic_ns, int)
+        #   body_hash: hash do corpo da requisição, bytes crus (detecta conflitos)
+        #   ref: (user_id, request_id) → localiza a resposta no Dynamo
+        self._store: "OrderedDict[str, Tuple[int, bytes, Tuple[str, str]]]" = OrderedDict()
+
+        # Cache quente de respostas completas (teto pequeno, LRU)
+        # - replays recentes ainda evitam o GetItem no Dynamo
+        self._hot: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
 
-        # Dicionário de locks por chave
+        # Dicionário de locks por chave (também limitado — cada Idempotency-Key
+        # única deixava um asyncio.Lock morto para trás, sem teto)
         # - evita condição de corrida quando duas requisições chegam ao mesmo tempo
         # - exemplo: cliente dispara 2x a mesma request em paralelo
-        self._locks: Dict[str, asyncio.Lock] = {}
+        self._locks: "OrderedDict[str, asyncio.Lock]" = OrderedDict()
+
+        # Última varredura de expirados (sweep preguiçoso)
+        self._last_sweep = self._now()
         
         # --------------------------------------------------
         # Métodos auxiliares privados
         # --------------------------------------------------
 
-    def _now(self) -> float:
+    def _now(self) -> int:
+        """
+        Retorna o relógio monotônico em nanossegundos (int)
+        """
+        return time.monotonic_ns()
+
+    def _sweep(self, now: int) -> None:
         """
-        Retorna o timestamp atual (epoch time - em segundos)
+        Varredura preguiçosa de entradas expiradas
+        - Roda no máximo a cada ttl/4 (amortizada nos get/put, sem task extra)
+        - Como o OrderedDict preserva ordem de inserção (≈ idade), basta
+            remover do início até achar a primeira entrada viva → O(expirados),
+            não O(n) por chamada
+        - Locks órfãos (não travados) também são descartados além do teto
         """
-        return time.time()
+        if now - self._last_sweep < self.ttl_ns // 4:
+            return
+        self._last_sweep = now
+        while self._store:
+            key, (ts, _, _) = next(iter(self._store.items()))
+            if now - ts <= self.ttl_ns:
+                break
+            del self._store[key]
+            self._hot.pop(key, None)
+        if len(self._locks) > self.max_entries:
+            for key in list(self._locks):
+                if len(self._locks) <= self.max_entries:
+                    break
+                lock = self._locks[key]
+                # só removemos locks livres — um lock .locked() está em uso
+                if not lock.locked():
+                    del self._locks[key]
     
-    def _hash_body(self, body: Any) -> str:
+    def _hash_body(self, body: Any) -> bytes:
         """
-        Calcula hash SHA-256 do corpo da requisição
+        Calcula fingerprint BLAKE2b do corpo da requisição
         - O json.dumps com sort_keys=True garante que a ordem das chaves
             não afete o hash (consistência determinística)
-        - Isso garante que o mesmo payload gere sempre o mesmo hash
+        - BLAKE2b é bem mais rápido que SHA-256 e aqui não precisamos de
+            resistência criptográfica, só de detectar corpos diferentes
+        - digest_size=16 (128 bits) é mais que suficiente para esse fim
+        - Retorna bytes crus (.digest()): o hash só serve para comparação
+            de igualdade, e bytes == bytes é um memcmp direto — hexdigest()
+            dobrava o tamanho armazenado por entrada sem ganhar nada
+        - Corpos já serializados (bytes/str, ex. model_dump_json do Pydantic)
+            são hasheados direto, sem um novo round-trip de JSON
+        - Dicts passam por orjson com OPT_SORT_KEYS: a canonicalização roda
+            em código nativo e já devolve bytes (sem o sort em Python do
+            json.dumps(sort_keys=True) nem o .encode() extra)
         """
+        if isinstance(body, bytes):
+            return hashlib.blake2b(body, digest_size=16).digest()
+        if isinstance(body, str):
+            return hashlib.blake2b(body.encode("utf-8"), digest_size=16).digest()
         # hash determinístico do corpo (ordena chaves para estabilidade)
-        raw = json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")
-        return hashlib.sha256(raw).hexdigest()
+        raw = orjson.dumps(body, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(raw, digest_size=16).digest()
 
     async def acquire_lock(self, key:str) -> asyncio.Lock:
         """
-        Retorna um asyncio.Lock para a chave
-        - Se não existir, cria um novo lock
-        - Faz lock.adquire() → só uma coroutine pode prosseguir por vez
-        - Isso previne que duas requisições emultâneas processe a mesma chave
+        Retorna um asyncio.Lock para a chave, JÁ adquirido
+        - setdefault é uma única operação de dict (atômica sob o GIL),
+            em vez do par get + insert condicional com duplo lookup
+        - Caso comum: nenhuma duplicata concorrente → o lock está livre e
+            acquire() retorna na hora, sem round-trip pelo scheduler
+        - O caller DEVE liberar com lock.release() (idealmente em finally)
         """
-        lock = self._locks.get(key)
-        if not lock:
-            lock = asyncio.Lock()
-            self._locks[key] = lock
+        lock = self._locks.setdefault(key, asyncio.Lock())
         await lock.acquire()
         return lock
     
-    def body_hash(self, body: Any) -> str:
+    def body_hash(self, body: Any) -> bytes:
         """
-        Wrapper público para gerar hash de um corpo
+        Wrapper público para gerar hash de um corpo (bytes crus)
         Usado no main.py para comparar se um Idempotency-Key
         está sendo reutilizado com corpo diferente (→ erro 409)
         """
         return self._hash_body(body)
-    
+
     def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
         """
         Retorna a entrada armazenada para uma chave, se existir e não tiver expirado
         Se a entrada expirou, ela é removida e retorna None
+        - "data" só vem preenchido se a resposta ainda está no cache quente;
+            caso contrário o caller rehidrata via "ref" (GetItem no Dynamo)
         """
+        self._sweep(self._now())
         entry = self._store.get(key)
         if not entry:
             return None
-        ts, body_hash, data = entry
-        if self._now() - ts > self.ttl:
+        ts, body_hash, ref = entry
+        if self._now() - ts > self.ttl_ns:
             #expirou → limpa
             del self._store[key]
+            self._hot.pop(key, None)
             return None
         return {
             "ts": ts,
             "body_hash": body_hash,
-            "data": data
+            "ref": ref,
+            "data": self._hot.get(key)
         }
     
-    def put(self, key: str, body: Any, data: Dict[str, Any]) -> None:
+    def put(self, key: str, body: Any, ref: Tuple[str, str],
+            data: Optional[Dict[str, Any]] = None) -> None:
         """
         Adiciona ou substitui uma entrada no store
         - Guarda o timestamp atual
         - Guarda o hash do corpo
-        - Garda a resposta (data)
+        - Guarda a referência (user_id, request_id) da resposta no Dynamo
+        - data (opcional) entra no cache quente → replays recentes sem GetItem
+        - Mantém os tetos max_entries/hot_entries (LRU) e o sweep preguiçoso
         """
-        self._store[key] = (self._now(), self._hash_body(body), data)
\ No newline at end of file
+        now = self._now()
+        self._store[key] = (now, self._hash_body(body), ref)
+        self._store.move_to_end(key)
+        if len(self._store) > self.max_entries:
+            old_key, _ = self._store.popitem(last=False)
+            self._hot.pop(old_key, None)
+        if data is not None:
+            self._hot[key] = data
+            self._hot.move_to_end(key)
+            if len(self._hot) > self.hot_entries:
+                self._hot.popitem(last=False)
+        self._sweep(now)
\ No newline at end of file
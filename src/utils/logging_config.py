@@ -1,10 +1,44 @@
 import logging
 
+import orjson
+
+class OrjsonFormatter(logging.Formatter):
+    """
+    Formatter estruturado (JSON via orjson)
+    - O formatter padrão com %(asctime)s roda strftime + localtime em CADA
+        registro — um caminho cheio de syscalls que vira sumidouro de CPU
+        sob carga de requisições
+    - Aqui emitimos o timestamp numérico (record.created) e deixamos o
+        shipper/CloudWatch formatar a data se quiser
+    - JSON estruturado também é mais amigável para agregadores de log
+    (picologging seria um drop-in ~4x mais rápido, mas é mais uma dependência
+        nativa; eliminar o strftime já remove o maior custo por registro)
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": record.created,
+            "lvl": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(out).decode("utf-8")
+
 def configure_logging():
     """
     Configura logging básico para todo o projeto
     """
-    logging.basicConfig(
-        level = logging.INFO,
-        format="%(asctime)s %(levelname)s %(name)s %(message)s"
-    )
\ No newline at end of file
+    handler = logging.StreamHandler()
+    handler.setFormatter(OrjsonFormatter())
+    logging.basicConfig(level = logging.INFO, handlers=[handler])
+
+    # Por padrão, TODO LogRecord coleta thread, pid e frame de origem
+    # (sys._getframe + os.getpid a cada registro) — e nenhum formatter
+    # nosso usa esses campos. Desligar poupa esse custo em cada log emitido,
+    # o maior ganho isolado de performance no logging do stdlib
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging._srcfile = None
\ No newline at end of file
@@ -1,15 +1,30 @@
 # --------------------------------------------------
 # src/utils/rety.py
 # --------------------------------------------------
-# Retry assíncrono com backoff exponencial + jitter
+# Retry assíncrono com backoff exponencial + jitter decorrelacionado
 #
 # Em termos de aprendizado
 # - Resiliência frente a falhas transitórias de serviços externos
 # - Evitar tempestades (thundering herd) com jitter aleatório
+# - "Decorrelated jitter" (recomendação AWS): cada delay sorteia em
+#   [min_delay, prev*3] → retries concorrentes se espalham no tempo em vez
+#   de colidirem nas mesmas janelas contra um serviço já throttled
 
 import asyncio
 import random
-from typing import Awaitable, Callable, Iterable, Tuple, Type
+from functools import lru_cache
+from typing import Awaitable, Callable, Iterable, Optional, Tuple, Type
+
+@lru_cache(maxsize=None)
+def _build_schedule(attempts: int, min_delay: float, max_delay: float) -> Tuple[float, ...]:
+    """
+    Pré-computa os delays base do backoff exponencial (com teto em max_delay)
+    - Cacheado por política (attempts, min_delay, max_delay): retries repetidos
+        com a mesma política — o caso normal — não refazem 2**i + min() por
+        tentativa (relevante quando batches no Dynamo disparam retry às centenas)
+    - Só precisamos de attempts-1 delays: a última tentativa não dorme
+    """
+    return tuple(min(max_delay, min_delay * (2 ** i)) for i in range(attempts - 1))
 
 async def retry_async(
     func: Callable[[], Awaitable],
@@ -18,8 +33,22 @@ async def retry_async(
     min_delay: float = 0.2,
     max_delay: float = 2.0,
     exceptions: Iterable[type[BaseException]] = (Exception,),
-    jitter: bool = True
+    jitter: bool = True,
+    deadline: Optional[float] = None
 ):
+    """
+    Reexecuta func até attempts vezes em caso de exceção
+    - jitter=True → backoff com jitter decorrelacionado (padrão AWS):
+        delay sorteado em [min_delay, min(max_delay, delay_anterior * 3)]
+    - jitter=False → agenda exponencial determinística pré-computada
+    - deadline → orçamento TOTAL em segundos; se a próxima espera estourar
+        o orçamento, desiste e relança a última exceção (evita que um retry
+        storm segure coroutines vivas por minutos)
+    """
+    schedule = _build_schedule(attempts, min_delay, max_delay)
+    loop = asyncio.get_running_loop()
+    deadline_at = (loop.time() + deadline) if deadline is not None else None
+    prev_delay = min_delay
     last_exc = None
     for i in range(attempts):
         try:
@@ -28,8 +57,14 @@ async def retry_async(
             last_exc = e
             if i == attempts - 1:
                 break
-            delay = min(max_delay, min_delay * (2 ** i))
             if jitter:
-                delay = delay * (0.5 + random.random()) # 0.5x..1.5x
+                # decorrelated jitter: sorteia com base no delay anterior
+                delay = random.uniform(min_delay, min(max_delay, prev_delay * 3))
+                prev_delay = delay
+            else:
+                delay = schedule[i]
+            if deadline_at is not None and loop.time() + delay > deadline_at:
+                # orçamento estourado → não vale a pena dormir de novo
+                break
             await asyncio.sleep(delay)
     raise last_exc
\ No newline at end of file
@@ -1,17 +1,38 @@
 import re
 
+# Padrão único de PII, pré-compilado no import
+# - Funde as duas redações (email + token hex longo) em UMA alternância
+#   → uma única varredura O(n) sobre o texto, em vez de dois re.sub
+#   (cada re.sub pagava lookup no cache de compilação + um scan completo)
+# - O grupo que casou (lastgroup) decide o texto de substituição
+_PII_RE = re.compile(
+    r"(?P<email>[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)"  # emails
+    r"|(?P<token>\b[0-9a-fA-F]{20,}\b)"  # hex longo (AWS keys, JWTs, etc.)
+)
+
+def _redact(m: re.Match) -> str:
+    return "[REDACTED_EMAIL]" if m.lastgroup == "email" else "[REDACTED_TOKEN]"
+
 def sanitize_prompt_for_logging(prompt: str, max_len: int = 200) -> str:
     """
     Reduz e remove padrões óbvios de PII.
     Essa sanitização é simplificada apenas para ambiente de dev/test
     """
 
-    # remove emails
-    s = re.sub(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+", "[REDACTED_EMAIL]", prompt)
-    # remove long hex / token-like strings (ex.: AWS keys, token JWT longos)
-    s = re.sub(r"\b[0-9a-fA-F]{20,}\b", "[REDACTED_TOKEN]", s)
+    # Trunca ANTES de rodar a regex: num prompt de 50 KB pagávamos o scan
+    # inteiro para depois descartar 99% do texto → agora o custo é O(max_len)
+    # A fatia leva 64 chars de folga para não cortar um email/token no meio
+    # (o re-truncate abaixo garante o tamanho final)
+    truncated = len(prompt) > max_len
+    head = prompt[:max_len + 64] if truncated else prompt
+
+    # remove emails + tokens em um único passe
+    s = _PII_RE.sub(_redact, head)
 
     if len(s) > max_len:
         s = s[:max_len] + "...[truncated]"
+    elif truncated:
+        # a redação encurtou o texto abaixo de max_len, mas houve corte
+        s = s + "...[truncated]"
 
     return s
\ No newline at end of file
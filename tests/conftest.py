@@ -0,0 +1,61 @@
+# --------------------------------------------------
+# tests/conftest.py
+# --------------------------------------------------
+# Fixtures compartilhadas entre os testes
+# - Material de chave: geramos um par RSA efêmero POR SESSÃO e apontamos
+#   JWKS_PATH/PRIVATE_KEY_PATH (via env) para ele ANTES de importar o app
+#   → nenhum private.pem precisa existir (nem ser commitado) para a suíte
+#   rodar, e o jwks.json versionado não é tocado
+# - Um único AsyncClient por sessão: cada `async with AsyncClient(...)`
+#   por teste reconstruía o ASGITransport e os internals do HTTPX
+# - Com escopo de sessão, transporte + app (e o mock do Dynamo por baixo)
+#   são montados UMA vez para a suíte inteira
+
+import os
+import tempfile
+from base64 import urlsafe_b64encode
+from pathlib import Path
+
+import orjson
+import pytest_asyncio
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from httpx import AsyncClient, ASGITransport
+
+def _b64url_uint(n: int) -> str:
+    """Codifica um inteiro no formato base64url usado em campos JWK (n, e)"""
+    raw = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    return urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+# Par de chaves efêmero da sessão de testes (kid igual ao usado no login mock)
+_key_dir = Path(tempfile.mkdtemp(prefix="awsproject-test-keys-"))
+_private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+(_key_dir / "private.pem").write_bytes(
+    _private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+)
+_public = _private_key.public_key().public_numbers()
+(_key_dir / "jwks.json").write_bytes(orjson.dumps({
+    "keys": [{
+        "kty": "RSA",
+        "kid": "test-key-1",
+        "use": "sig",
+        "alg": "RS256",
+        "n": _b64url_uint(_public.n),
+        "e": _b64url_uint(_public.e),
+    }]
+}))
+os.environ["JWKS_PATH"] = str(_key_dir / "jwks.json")
+os.environ["PRIVATE_KEY_PATH"] = str(_key_dir / "private.pem")
+
+# O import carrega chaves/JWKS dos caminhos acima → precisa vir depois do env
+from src.main import app  # noqa: E402
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
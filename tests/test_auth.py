@@ -1,14 +1,97 @@
+import base64
+import json
+import time
+from pathlib import Path
+
+import jwt
 import pytest
-from httpx import AsyncClient, ASGITransport
 
-from src.main import app
+from src.config import settings
+
+def _mint_token(claims: dict, kid: str = "test-key-1") -> str:
+    """Assina um token com a chave privada efêmera da sessão (via PyJWT)"""
+    pem = Path(settings.PRIVATE_KEY_PATH).read_text()
+    return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": kid})
+
+def _claims(**overrides) -> dict:
+    now = int(time.time())
+    claims = {"sub": "mallory", "email": "mallory@teste.com", "iat": now, "exp": now + 3600}
+    claims.update(overrides)
+    return claims
+
+@pytest.mark.asyncio
+async def test_login_returns_jwt(client):
+    response = await client.post("v1/auth/login", json={"email": "teste@teste.com"})
+    assert response.status_code == 200
+    data = response.json()
+    assert "access_token" in data
+    assert data["token_type"] == "Bearer"
+
+# --------------------------------------------------
+# Rejeições do middleware → precisam chegar ao CLIENTE como 401 estruturado
+# (não um 500 da pilha de middleware)
+# --------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_missing_token_returns_401(client):
+    resp = await client.get("/v1/history")
+    assert resp.status_code == 401
+    assert "detail" in resp.json()
+
+@pytest.mark.asyncio
+async def test_garbage_token_returns_401(client):
+    resp = await client.get("/v1/history", headers={"Authorization": "Bearer nao.e.jwt"})
+    assert resp.status_code == 401
+
+@pytest.mark.asyncio
+async def test_non_ascii_token_returns_401(client):
+    # headers HTTP aceitam latin-1; um JWT válido é sempre ASCII
+    hdr = "Bearer café.token.sig".encode("latin-1")
+    resp = await client.get("/v1/history", headers=[(b"authorization", hdr)])
+    assert resp.status_code == 401
+
+# --------------------------------------------------
+# Casos negativos da verificação RS256 manual (verify_rs256/_split)
+# — a reescrita da verificação não pode aceitar nada que o jwt.decode rejeitava
+# --------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_tampered_signature_returns_401(client):
+    login = await client.post("v1/auth/login", json={"email": "teste@teste.com"})
+    header_b64, payload_b64, sig_b64 = login.json()["access_token"].split(".")
+    # corrompe um caractere da assinatura mantendo base64url válido
+    tampered_sig = ("B" if sig_b64[0] != "B" else "C") + sig_b64[1:]
+    resp = await client.get(
+        "/v1/history",
+        headers={"Authorization": f"Bearer {header_b64}.{payload_b64}.{tampered_sig}"}
+    )
+    assert resp.status_code == 401
+
+@pytest.mark.asyncio
+async def test_forged_payload_returns_401(client):
+    login = await client.post("v1/auth/login", json={"email": "teste@teste.com"})
+    header_b64, payload_b64, sig_b64 = login.json()["access_token"].split(".")
+    # troca o payload (sub escalado) mas mantém a assinatura original
+    payload = json.loads(base64.urlsafe_b64decode(payload_b64 + "=="))
+    payload["sub"] = "admin"
+    forged_b64 = base64.urlsafe_b64encode(
+        json.dumps(payload).encode()
+    ).rstrip(b"=").decode()
+    resp = await client.get(
+        "/v1/history",
+        headers={"Authorization": f"Bearer {header_b64}.{forged_b64}.{sig_b64}"}
+    )
+    assert resp.status_code == 401
+
+@pytest.mark.asyncio
+async def test_expired_token_returns_401(client):
+    token = _mint_token(_claims(exp=int(time.time()) - 10))
+    resp = await client.get("/v1/history", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 401
 
 @pytest.mark.asyncio
-async def test_login_returns_jwt():
-    transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url="http://test") as client:
-        response = await client.post("v1/auth/login", json={"email": "teste@teste.com"})
-        assert response.status_code == 200
-        data = response.json()
-        assert "access_token" in data
-        assert data["token_type"] == "Bearer"
\ No newline at end of file
+async def test_unknown_kid_returns_401(client):
+    # assinatura válida, mas com kid fora do JWKS → não há chave para verificar
+    token = _mint_token(_claims(), kid="rogue-key")
+    resp = await client.get("/v1/history", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 401
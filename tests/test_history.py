@@ -1,30 +1,56 @@
 import pytest
-from httpx import AsyncClient, ASGITransport
 
-from src.main import app
+@pytest.mark.asyncio
+async def test_history_returns_items(client):
+    # 1 login
+    login_resp = await client.post("/v1/auth/login", json={"email": "teste@teste.com"})
+    token = login_resp.json()["access_token"]
+
+    # 2 Gera um prompt (isso vai salvar no Dynamo simulado)
+    await client.post(
+        "/v1/generate",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"prompt": "histórico teste"}
+    )
+
+    # 3 Consulta o histórico (mais recentes primeiro)
+    history_resp = await client.get(
+        "/v1/history",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert history_resp.status_code == 200
+    data = history_resp.json()
+    items = data["items"]
+    assert len(items) > 0
+    assert items[0]["prompt"] == "histórico teste"
 
 @pytest.mark.asyncio
-async def test_history_returns_items():
-    transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url="http://test") as client:
-        # 1 login
-        login_resp = await client.post("/v1/auth/login", json={"email": "teste@teste.com"})
-        token = login_resp.json()["access_token"]
-
-        # 2 Gera um prompt (isso vai salvar no Dynamo simulado)
+async def test_history_pagination_cursor(client):
+    # 1 login
+    login_resp = await client.post("/v1/auth/login", json={"email": "paginado@teste.com"})
+    token = login_resp.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # 2 Gera itens suficientes para mais de uma página
+    for i in range(3):
         await client.post(
             "/v1/generate",
-            headers={"Authorization": f"Bearer {token}"},
-            json={"prompt": "histórico teste"}
+            headers=headers,
+            json={"prompt": f"página {i}"}
         )
 
-        # 3 Consulta o histórico
-        history_resp = await client.get(
-            "/v1/history",
-            headers={"Authorization": f"Bearer {token}"}
-        )
+    # 3 Primeira página com limit=2 → deve vir next_cursor
+    page1 = (await client.get("/v1/history?limit=2", headers=headers)).json()
+    assert len(page1["items"]) == 2
+    assert page1["next_cursor"] is not None
 
-        assert history_resp.status_code == 200
-        items = history_resp.json()
-        assert len(items) > 0
-        assert items[0]["prompt"] == "histórico teste"
\ No newline at end of file
+    # 4 Segunda página via cursor → itens restantes, sem repetição
+    page2 = (await client.get(
+        f"/v1/history?limit=2&cursor={page1['next_cursor']}",
+        headers=headers
+    )).json()
+    assert len(page2["items"]) >= 1
+    ids_page1 = {i["request_id"] for i in page1["items"]}
+    ids_page2 = {i["request_id"] for i in page2["items"]}
+    assert not ids_page1 & ids_page2
@@ -0,0 +1,29 @@
+import pytest
+
+from src.main import dynamo_repo
+
+@pytest.mark.asyncio
+async def test_save_items_chunks_and_dedupes():
+    # 30 itens → força mais de um lote de 25 no BatchWriteItem
+    items = [
+        {
+            "user_id": "batch-user",
+            "request_id": f"{i:026x}",
+            "prompt": f"prompt {i}",
+            "response": {"generated": f"resposta {i}", "n": i},
+        }
+        for i in range(30)
+    ]
+    # chave duplicada no mesmo lote → o último item vence (dedup pré-envio)
+    items.append({**items[0], "prompt": "sobrescrito"})
+
+    await dynamo_repo.save_items(items)
+
+    # o duplicado não pode causar erro nem gerar item extra
+    page, _ = await dynamo_repo.list_items("batch-user", limit=100)
+    assert len(page) == 30
+
+    first = await dynamo_repo.get_item("batch-user", items[0]["request_id"])
+    assert first["prompt"] == "sobrescrito"
+    # response faz round-trip exato (int continua int)
+    assert first["response"]["n"] == 0